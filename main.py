@@ -1,16 +1,41 @@
 import os
 import re
+import sys
 import csv
+import copy
 import json
+import time
+import pickle
+import signal as signals
 import logging
+import threading
+import cProfile
+import functools
+import contextlib
+import contextvars
+import collections
+from abc import ABC, abstractmethod
+import multiprocessing
 from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Client, Listener
+from queue import Full, Queue
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 from decimal import Decimal, ROUND_DOWN
 from dotenv import load_dotenv
-from telethon import TelegramClient, events
+from telethon import TelegramClient, events, utils
+from telethon.sessions import SQLiteSession, StringSession
+from telethon.tl import types
 from pybit.unified_trading import HTTP
 
 logging.basicConfig(
-    format="%(asctime)s - %(levelname)s - %(message)s", level=logging.DEBUG
+    format="%(asctime)s - %(processName)s - %(levelname)s - %(message)s",
+    level=logging.DEBUG,
 )
 logging.getLogger("telethon").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
@@ -26,6 +51,55 @@ BYBIT_API_SECRET = os.getenv("BYBIT_API_SECRET")
 TELEGRAM_CHANNEL_ID = os.getenv("TELEGRAM_CHANNEL_ID")
 # IS_TESTNET = os.getenv("IS_TESTNET")
 
+# --- Режим запуска ---
+# single: один процесс (Telethon + Bybit), split: listener-процессы -> очередь -> executor
+BOT_MODE = os.getenv("BOT_MODE", "single").strip().lower()
+LISTENER_PROCESSES = max(1, int(os.getenv("LISTENER_PROCESSES", "1")))
+SIGNAL_QUEUE_SIZE = int(os.getenv("SIGNAL_QUEUE_SIZE", "1000"))
+
+# --- Облегчённая сессия Telethon ---
+# TELEGRAM_LEAN_SESSION=1: сессия в памяти (StringSession, сохраняется в
+# <SESSION_NAME>.session.json при изменении), целевые каналы резолвятся один
+# раз, апдейты чужих чатов отбрасываются до диспетчеризации событий.
+TELEGRAM_LEAN_SESSION = os.getenv("TELEGRAM_LEAN_SESSION", "0").strip().lower() in (
+    "1",
+    "true",
+    "yes",
+)
+# лимит строк кэша сущностей в сессии; внутренний кэш Telethon
+# (entity_cache_limit) остаётся со значением по умолчанию
+TELEGRAM_ENTITY_CACHE_LIMIT = int(os.getenv("TELEGRAM_ENTITY_CACHE_LIMIT", "200"))
+
+# --- Hot-standby (active/standby) ---
+# HA_ENABLED=1: экземпляр, захвативший HA_LEASE_FILE, активен и стримит книгу
+# позиций и журнал на HA_REPLICATION_ADDRESS; второй экземпляр ждёт lease
+# с копией состояния и прогретыми HTTP-клиентами бирж (балансы, а при
+# нескольких биржах и цены, обновляются чаще их TTL). Telegram на standby не подключён: одну сессию
+# нельзя держать в двух процессах, поэтому после takeover клиент
+# подключается и резолвит каналы с нуля.
+HA_ENABLED = os.getenv("HA_ENABLED", "0").strip().lower() in ("1", "true", "yes")
+HA_LEASE_FILE = os.getenv("HA_LEASE_FILE", "bot.lease")
+HA_REPLICATION_ADDRESS = os.getenv("HA_REPLICATION_ADDRESS", "127.0.0.1:7470")
+HA_REPLICATION_AUTHKEY = (
+    os.getenv("HA_REPLICATION_AUTHKEY") or API_HASH or "cryptobot"
+).encode()
+HA_LEASE_POLL = float(os.getenv("HA_LEASE_POLL", "1"))
+# верхняя граница периода прогрева; фактический период — не больше половины
+# BALANCE_CACHE_TTL и PRICE_CACHE_TTL
+HA_WARM_INTERVAL = float(os.getenv("HA_WARM_INTERVAL", "30"))
+
+# --- Профилирование по запросу ---
+# Команды пишутся в PROFILE_TRIGGER_FILE (файл удаляется после чтения):
+#   trace N     — дерево спанов (parse/balance/order/decode/persist) следующих N сигналов
+#   cprofile N  — cProfile следующих N вызовов place_order_on_bybit()
+#   sample S    — сэмплирующий профиль всех потоков в течение S секунд
+#   off         — отменить всё, что ещё не сработало
+# Результаты: PROFILE_DIR/*.trace.json (Chrome Trace / Perfetto / speedscope),
+# *.prof (pstats: snakeviz, flameprof), *.folded (flamegraph.pl, speedscope).
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_TRIGGER_FILE = os.getenv("PROFILE_TRIGGER_FILE", "profile.trigger")
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+
 SPOT_SYMBOLS = [
     s.strip().upper()
     for s in os.getenv("SPOT_SYMBOLS", "BTCUSDT,ETHUSDT,XRPUSDT,ADAUSDT").split(",")
@@ -49,43 +123,318 @@ if _spot_decimals_env:
 # --- Файлы для логов/хранения позиций ---
 TRADES_CSV = "trades.csv"
 POSITIONS_JSON = "positions.json"
+LAST_MESSAGES_JSON = "last_messages.json"
+TRADES_HEADER = [
+    "timestamp",
+    "symbol",
+    "side",
+    "order_id",
+    "exec_price",
+    "exec_qty",
+    "fee",
+    "fee_currency",
+    "realized_pnl",
+    "notes",
+]
 
-if not os.path.exists(TRADES_CSV):
-    with open(TRADES_CSV, "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(
-            [
-                "timestamp",
-                "symbol",
-                "side",
-                "order_id",
-                "exec_price",
-                "exec_qty",
-                "fee",
-                "fee_currency",
-                "realized_pnl",
-                "notes",
-            ]
-        )
 
+def ensure_trades_csv(path):
+    if not os.path.exists(path):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(TRADES_HEADER)
 
-# --- Вспомогательные функции ---
-def load_positions():
-    if os.path.exists(POSITIONS_JSON):
-        with open(POSITIONS_JSON, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
 
+# --- Аккаунты Bybit ---
+# Без BYBIT_ACCOUNTS работает один аккаунт с BYBIT_API_KEY/BYBIT_API_SECRET и
+# файлами trades.csv/positions.json. BYBIT_ACCOUNTS=main,sub1 включает fan-out:
+# ключи берутся из BYBIT_API_KEY_MAIN/BYBIT_API_SECRET_MAIN и т.д., журнал и
+# позиции каждого аккаунта пишутся в trades_<name>.csv/positions_<name>.json.
+BYBIT_ACCOUNTS = [
+    a.strip() for a in os.getenv("BYBIT_ACCOUNTS", "").split(",") if a.strip()
+]
+BALANCE_CACHE_TTL = float(os.getenv("BALANCE_CACHE_TTL", "5"))
+
+# --- Биржи и маршрутизация ---
+# EXCHANGES — список адаптеров для каждого аккаунта (см. EXCHANGE_ADAPTERS),
+# ROUTING_MODE=price выбирает биржу с лучшей ценой, latency — с меньшей задержкой.
+EXCHANGES = [
+    e.strip().lower() for e in os.getenv("EXCHANGES", "bybit").split(",") if e.strip()
+]
+DEFAULT_VENUE = EXCHANGES[0] if EXCHANGES else "bybit"
+ROUTING_MODE = os.getenv("ROUTING_MODE", "price").strip().lower()
+PRICE_CACHE_TTL = float(os.getenv("PRICE_CACHE_TTL", "2"))
+
+# --- Лимиты риска (0 — лимит выключен) ---
+RISK_MAX_SYMBOL_NOTIONAL = Decimal(os.getenv("RISK_MAX_SYMBOL_NOTIONAL", "0"))
+RISK_MAX_TOTAL_EXPOSURE = Decimal(os.getenv("RISK_MAX_TOTAL_EXPOSURE", "0"))
+RISK_MAX_DAILY_LOSS = Decimal(os.getenv("RISK_MAX_DAILY_LOSS", "0"))
+# открытый ордер — исполненная покупка/продажа, чей лот ещё не закрыт встречной
+# сделкой (рыночные ордера синхронны, ордеров "в полёте" между сигналами нет)
+RISK_MAX_OPEN_ORDERS = int(os.getenv("RISK_MAX_OPEN_ORDERS", "0"))
+
+
+class AccountLogger(logging.LoggerAdapter):
+    def process(self, msg, kwargs):
+        return f"[{self.extra['account']}] {msg}", kwargs
+
+
+class Account:
+    def __init__(self, name, api_key, api_secret, trades_csv, positions_json):
+        self.name = name
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.trades_csv = trades_csv
+        self.positions_json = positions_json
+        self.logger = AccountLogger(logger, {"account": name})
+        self.adapters = []
+        self.router = None
+        # книга позиций в памяти: читается с диска один раз, пишется при изменении
+        self.positions = None
+        # venue -> (баланс USDT, время получения)
+        self._balances_usdt = {}
+        self.risk = RiskEngine()
+        # защищает книгу позиций от чтения снимка для standby во время записи
+        self.lock = threading.Lock()
+
+    def connect(self, adapters=None):
+        # у каждого адаптера свой HTTP-клиент, т.е. свой пул соединений
+        if adapters is None:
+            adapters = [EXCHANGE_ADAPTERS[name](self) for name in EXCHANGES]
+        self.adapters = adapters
+        self.router = ExchangeRouter(adapters)
+        ensure_trades_csv(self.trades_csv)
+        return self.adapters
+
+    def get_adapter(self, venue):
+        for adapter in self.adapters:
+            if adapter.name == venue:
+                return adapter
+        return None
+
+    def invalidate_balance(self, venue):
+        self._balances_usdt.pop(venue, None)
+
+
+def load_accounts():
+    if not BYBIT_ACCOUNTS:
+        return [
+            Account(
+                "default", BYBIT_API_KEY, BYBIT_API_SECRET, TRADES_CSV, POSITIONS_JSON
+            )
+        ]
+    accounts = []
+    for name in BYBIT_ACCOUNTS:
+        suffix = name.upper()
+        api_key = os.getenv(f"BYBIT_API_KEY_{suffix}")
+        api_secret = os.getenv(f"BYBIT_API_SECRET_{suffix}")
+        if not api_key or not api_secret:
+            raise ValueError(
+                f"для аккаунта {name} не заданы "
+                f"BYBIT_API_KEY_{suffix}/BYBIT_API_SECRET_{suffix}"
+            )
+        accounts.append(
+            Account(
+                name,
+                api_key,
+                api_secret,
+                f"trades_{name}.csv",
+                f"positions_{name}.json",
+            )
+        )
+    return accounts
+
+
+# --- Риск-менеджмент ---
+class RiskEngine:
+    """Агрегаты риска, обновляемые на каждом fill; проверки лимитов за O(1)."""
+
+    def __init__(
+        self,
+        max_symbol_notional=None,
+        max_total_exposure=None,
+        max_daily_loss=None,
+        max_open_orders=None,
+    ):
+        self.max_symbol_notional = (
+            RISK_MAX_SYMBOL_NOTIONAL
+            if max_symbol_notional is None
+            else Decimal(max_symbol_notional)
+        )
+        self.max_total_exposure = (
+            RISK_MAX_TOTAL_EXPOSURE
+            if max_total_exposure is None
+            else Decimal(max_total_exposure)
+        )
+        self.max_daily_loss = (
+            RISK_MAX_DAILY_LOSS if max_daily_loss is None else Decimal(max_daily_loss)
+        )
+        self.max_open_orders = (
+            RISK_MAX_OPEN_ORDERS if max_open_orders is None else max_open_orders
+        )
+        self.symbol_notional = {}
+        self.total_exposure = Decimal("0")
+        self.daily_realized = Decimal("0")
+        self.day = datetime.now(timezone.utc).date()
+        # symbol -> число открытых лотов в книге позиций, open_orders — их сумма
+        self.symbol_lots = {}
+        self.open_orders = 0
+        self._lock = threading.Lock()
+
+    def _roll_day(self):
+        today = datetime.now(timezone.utc).date()
+        if today != self.day:
+            self.day = today
+            self.daily_realized = Decimal("0")
+
+    @staticmethod
+    def position_lots(pos):
+        return len(pos.get("longs", [])) + len(pos.get("shorts", []))
+
+    @staticmethod
+    def position_notional(pos):
+        total = Decimal("0")
+        for lot in pos.get("longs", []) + pos.get("shorts", []):
+            total += to_decimal(lot.get("qty", "0")) * to_decimal(lot.get("price", "0"))
+        return total
+
+    def bootstrap(self, positions, trades_csv=None):
+        # один полный проход при старте, дальше только инкрементальные обновления
+        with self._lock:
+            self.symbol_notional = {
+                symbol: self.position_notional(pos) for symbol, pos in positions.items()
+            }
+            self.total_exposure = sum(self.symbol_notional.values(), Decimal("0"))
+            self.symbol_lots = {
+                symbol: self.position_lots(pos) for symbol, pos in positions.items()
+            }
+            self.open_orders = sum(self.symbol_lots.values())
+            self.daily_realized = Decimal("0")
+            self.day = datetime.now(timezone.utc).date()
+            if trades_csv and os.path.exists(trades_csv):
+                self.daily_realized = self._realized_today_from_ledger(trades_csv)
+
+    def _realized_today_from_ledger(self, trades_csv):
+        # realized_pnl в журнале накопительный по символу: дневной результат —
+        # разница между последним значением за сегодня и последним до сегодня
+        today = self.day.isoformat()
+        before, last = {}, {}
+        with open(trades_csv, "r", newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                realized = row.get("realized_pnl")
+                if not realized:
+                    continue
+                symbol = row.get("symbol", "")
+                if (row.get("timestamp") or "")[:10] == today:
+                    last[symbol] = to_decimal(realized)
+                else:
+                    before[symbol] = to_decimal(realized)
+        return sum(
+            (
+                value - before.get(symbol, Decimal("0"))
+                for symbol, value in last.items()
+            ),
+            Decimal("0"),
+        )
 
-def save_positions(positions):
-    with open(POSITIONS_JSON, "w", encoding="utf-8") as f:
-        json.dump(positions, f, ensure_ascii=False, indent=2)
+    def check(self, symbol, side, notional):
+        """Возвращает причину отказа или None, если ордер проходит лимиты."""
+        with self._lock:
+            self._roll_day()
+            # продажа только сокращает позицию — лимиты ограничивают новые покупки
+            if side != "Buy":
+                return None
+            notional = to_decimal(notional)
+            if self.max_open_orders and self.open_orders >= self.max_open_orders:
+                return f"open_orders {self.open_orders} >= {self.max_open_orders}"
+            if self.max_daily_loss and -self.daily_realized >= self.max_daily_loss:
+                return f"daily_loss {-self.daily_realized} >= {self.max_daily_loss}"
+            current = self.symbol_notional.get(symbol, Decimal("0"))
+            if (
+                self.max_symbol_notional
+                and current + notional > self.max_symbol_notional
+            ):
+                return f"{symbol} notional {current}+{notional} > {self.max_symbol_notional}"
+            if (
+                self.max_total_exposure
+                and self.total_exposure + notional > self.max_total_exposure
+            ):
+                return f"exposure {self.total_exposure}+{notional} > {self.max_total_exposure}"
+        return None
+
+    def on_fill(self, symbol, pos, realized_delta):
+        notional = self.position_notional(pos)
+        lots = self.position_lots(pos)
+        with self._lock:
+            self.open_orders += lots - self.symbol_lots.get(symbol, 0)
+            self.symbol_lots[symbol] = lots
+            self._roll_day()
+            self.total_exposure += notional - self.symbol_notional.get(
+                symbol, Decimal("0")
+            )
+            self.symbol_notional[symbol] = notional
+            self.daily_realized += to_decimal(realized_delta)
+
+
+def reject_by_risk(account, symbol, side, notional):
+    reason = account.risk.check(symbol, side, notional)
+    if reason is None:
+        return False
+    account.logger.warning(f"Ордер {side} {symbol} отклонён риск-лимитом: {reason}")
+    write_trade_row(
+        account,
+        [
+            datetime.now(timezone.utc).isoformat(),
+            symbol,
+            side,
+            "",
+            "",
+            "",
+            "",
+            "",
+            "",
+            f"risk_rejected: {reason}",
+        ],
+    )
+    return True
 
 
-def write_trade_row(row):
-    with open(TRADES_CSV, "a", newline="", encoding="utf-8") as f:
+# --- Вспомогательные функции ---
+def load_positions(account):
+    if account.positions is None:
+        account.positions = {}
+        if os.path.exists(account.positions_json):
+            with open(account.positions_json, "r", encoding="utf-8") as f:
+                account.positions = json.load(f)
+    return account.positions
+
+
+def save_positions(account, positions):
+    account.positions = positions
+    # через временный файл: standby перечитывает его при takeover
+    tmp_path = f"{account.positions_json}.tmp"
+    with span("persist"):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(positions, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, account.positions_json)
+
+
+def write_trade_row(account, row):
+    with span("persist"), open(
+        account.trades_csv, "a", newline="", encoding="utf-8"
+    ) as f:
         writer = csv.writer(f)
         writer.writerow(row)
+    replicate("trade", account.name, row)
+
+
+# --- Репликация на standby (см. HA_ENABLED) ---
+replicator = None
+
+
+def replicate(kind, *payload):
+    if replicator is not None:
+        replicator.publish((kind,) + payload)
 
 
 def to_decimal(x):
@@ -108,10 +457,21 @@ def round_down_decimal(value: Decimal, precision: int) -> Decimal:
         return to_decimal(value)
 
 
-def update_positions_and_compute_pnl(symbol, side, price, qty, fee=0):
-    positions = load_positions()
-    pos = positions.get(symbol, {"longs": [], "shorts": [], "realized_pnl_total": "0"})
+def lot_venue(lot):
+    # лоты, записанные до появления адаптеров, относятся к основной бирже
+    return lot.get("venue", DEFAULT_VENUE)
+
+
+def update_positions_and_compute_pnl(
+    account, symbol, side, price, qty, fee=0, venue=DEFAULT_VENUE
+):
+    positions = load_positions(account)
+    # лоты меняются на копии и подменяются в книге целиком под account.lock
+    pos = copy.deepcopy(
+        positions.get(symbol, {"longs": [], "shorts": [], "realized_pnl_total": "0"})
+    )
     realized = Decimal(pos.get("realized_pnl_total", "0"))
+    realized_before = realized
     price = to_decimal(price)
     qty = to_decimal(qty)
     fee = to_decimal(fee)
@@ -124,7 +484,7 @@ def update_positions_and_compute_pnl(symbol, side, price, qty, fee=0):
             for s in shorts:
                 s_qty = to_decimal(s["qty"])
                 s_price = to_decimal(s["price"])
-                if remaining <= 0:
+                if remaining <= 0 or lot_venue(s) != venue:
                     new_shorts.append(s)
                     continue
                 close_qty = min(s_qty, remaining)
@@ -132,16 +492,16 @@ def update_positions_and_compute_pnl(symbol, side, price, qty, fee=0):
                 realized += pnl - fee
                 remaining -= close_qty
                 if s_qty > close_qty:
-                    new_shorts.append(
-                        {"qty": str(s_qty - close_qty), "price": str(s_price)}
-                    )
+                    new_shorts.append(dict(s, qty=str(s_qty - close_qty)))
             pos["shorts"] = new_shorts
             if remaining > 0:
                 pos.setdefault("longs", []).append(
-                    {"qty": str(remaining), "price": str(price)}
+                    {"qty": str(remaining), "price": str(price), "venue": venue}
                 )
         else:
-            pos.setdefault("longs", []).append({"qty": str(qty), "price": str(price)})
+            pos.setdefault("longs", []).append(
+                {"qty": str(qty), "price": str(price), "venue": venue}
+            )
     else:  # Sell
         longs = pos.get("longs", [])
         remaining = qty
@@ -150,7 +510,7 @@ def update_positions_and_compute_pnl(symbol, side, price, qty, fee=0):
             for l in longs:
                 l_qty = to_decimal(l["qty"])
                 l_price = to_decimal(l["price"])
-                if remaining <= 0:
+                if remaining <= 0 or lot_venue(l) != venue:
                     new_longs.append(l)
                     continue
                 close_qty = min(l_qty, remaining)
@@ -158,38 +518,459 @@ def update_positions_and_compute_pnl(symbol, side, price, qty, fee=0):
                 realized += pnl - fee
                 remaining -= close_qty
                 if l_qty > close_qty:
-                    new_longs.append(
-                        {"qty": str(l_qty - close_qty), "price": str(l_price)}
-                    )
+                    new_longs.append(dict(l, qty=str(l_qty - close_qty)))
             pos["longs"] = new_longs
             if remaining > 0:
                 pos.setdefault("shorts", []).append(
-                    {"qty": str(remaining), "price": str(price)}
+                    {"qty": str(remaining), "price": str(price), "venue": venue}
                 )
         else:
-            pos.setdefault("shorts", []).append({"qty": str(qty), "price": str(price)})
+            pos.setdefault("shorts", []).append(
+                {"qty": str(qty), "price": str(price), "venue": venue}
+            )
 
     pos["realized_pnl_total"] = str(realized)
-    positions[symbol] = pos
-    save_positions(positions)
+    with account.lock:
+        positions[symbol] = pos
+        account.risk.on_fill(symbol, pos, realized - realized_before)
+        save_positions(account, positions)
+        # публикуем под той же блокировкой, что и снимок для standby
+        replicate("position", account.name, symbol, pos)
     return realized
 
 
+# --- Профилирование: спаны, cProfile, сэмплер ---
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    __slots__ = ("name", "start", "end", "tid", "children", "_token")
+
+    def __init__(self, name):
+        self.name = name
+        self.start = self.end = None
+        self.tid = None
+        self.children = []
+        self._token = None
+
+    def __enter__(self):
+        self.tid = threading.get_ident()
+        self._token = _current_span.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.end = time.perf_counter()
+        _current_span.reset(self._token)
+        return False
+
+
+class SignalTrace(Span):
+    __slots__ = ()
+
+    def __exit__(self, *exc):
+        super().__exit__(*exc)
+        profiler.write_trace(self)
+        return False
+
+
+def span(name):
+    # без активной трассировки — один lookup contextvar и общий no-op объект
+    parent = _current_span.get()
+    if parent is None:
+        return NULL_SPAN
+    child = Span(name)
+    parent.children.append(child)
+    return child
+
+
+def signal_trace(name="signal"):
+    if profiler.trace_remaining <= 0 or not profiler.take("trace"):
+        return NULL_SPAN
+    return SignalTrace(name)
+
+
+def profiled(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if profiler.cprofile_remaining <= 0 or not profiler.take("cprofile"):
+            return func(*args, **kwargs)
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:
+            # другой профайлер уже активен (Python 3.12+) — выполняем без него
+            profiler.give_back("cprofile")
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            prof.disable()
+            profiler.write_cprofile(prof, func.__name__)
+
+    return wrapper
+
+
+class StackSampler(threading.Thread):
+    def __init__(self, duration, interval=PROFILE_SAMPLE_INTERVAL):
+        super().__init__(name="sampler", daemon=True)
+        self.duration = duration
+        self.interval = interval
+
+    def run(self):
+        counts = collections.Counter()
+        me = threading.get_ident()
+        deadline = time.monotonic() + self.duration
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                    )
+                    frame = frame.f_back
+                stack.append(names.get(tid, str(tid)))
+                counts[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+        profiler.write_folded(counts)
+
+
+class Profiler:
+    def __init__(self, out_dir=PROFILE_DIR):
+        self.out_dir = out_dir
+        self.trace_remaining = 0
+        self.cprofile_remaining = 0
+        self._sampler = None
+        self._watcher = None
+        self._lock = threading.Lock()
+
+    def take(self, kind):
+        attr = f"{kind}_remaining"
+        with self._lock:
+            left = getattr(self, attr)
+            if left <= 0:
+                return False
+            setattr(self, attr, left - 1)
+            return True
+
+    def give_back(self, kind):
+        # захват не состоялся — возвращаем слот следующему вызову
+        attr = f"{kind}_remaining"
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def command(self, text):
+        for part in (text.strip() or "trace 1\ncprofile 1").splitlines():
+            words = part.split()
+            if not words:
+                continue
+            kind = words[0].lower()
+            try:
+                arg = float(words[1]) if len(words) > 1 else None
+                # счётчики не меньше 0, длительность сэмплирования больше 0
+                if arg is not None and (arg <= 0 if kind == "sample" else arg < 0):
+                    raise ValueError(arg)
+                count = 1 if arg is None else int(arg)
+            except (ValueError, OverflowError):
+                logger.warning(f"Профилирование: неверный аргумент в '{part}'")
+                continue
+            with self._lock:
+                if kind == "trace":
+                    self.trace_remaining += count
+                elif kind == "cprofile":
+                    self.cprofile_remaining += count
+                elif kind == "off":
+                    self.trace_remaining = self.cprofile_remaining = 0
+                elif kind != "sample":
+                    logger.warning(f"Профилирование: неизвестная команда '{part}'")
+                    continue
+            if kind == "sample":
+                if self._sampler is not None and self._sampler.is_alive():
+                    logger.warning("Профилирование: сэмплер уже запущен.")
+                    continue
+                self._sampler = StackSampler(10 if arg is None else arg)
+                self._sampler.start()
+            logger.info(f"Профилирование: принята команда '{part}'")
+
+    def watch(self, path=PROFILE_TRIGGER_FILE, interval=1.0):
+        if self._watcher is not None:
+            return
+        self._watcher = threading.Thread(
+            target=self._watch_loop, args=(path, interval), name="profiler", daemon=True
+        )
+        self._watcher.start()
+
+    def _watch_loop(self, path, interval):
+        while True:
+            time.sleep(interval)
+            if not os.path.exists(path):
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    text = f.read()
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Профилирование: не удалось прочитать {path}: {e}")
+                continue
+            self.command(text)
+
+    def _output_path(self, kind, ext):
+        os.makedirs(self.out_dir, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        return os.path.join(self.out_dir, f"{stamp}-{os.getpid()}-{kind}.{ext}")
+
+    def write_cprofile(self, prof, name):
+        path = self._output_path(name, "prof")
+        prof.dump_stats(path)
+        logger.info(f"Профилирование: cProfile сохранён в {path}")
+
+    def write_trace(self, root):
+        trace_events = []
+        lines = []
+
+        def walk(node, depth):
+            if node.end is None:
+                return
+            trace_events.append(
+                {
+                    "name": node.name,
+                    "ph": "X",
+                    "ts": round((node.start - root.start) * 1e6, 1),
+                    "dur": round((node.end - node.start) * 1e6, 1),
+                    "pid": os.getpid(),
+                    "tid": node.tid,
+                }
+            )
+            lines.append(
+                f"{'  ' * depth}{node.name}: {(node.end - node.start) * 1000:.2f} ms"
+            )
+            for child in sorted(node.children, key=lambda c: c.start or 0):
+                walk(child, depth + 1)
+
+        walk(root, 0)
+        path = self._output_path("signal", "trace.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+        logger.info("Трассировка сигнала (%s):\n%s", path, "\n".join(lines))
+
+    def write_folded(self, counts):
+        path = self._output_path("sample", "folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in counts.most_common():
+                f.write(f"{stack} {count}\n")
+        logger.info(f"Профилирование: сэмплы сохранены в {path}")
+
+
+profiler = Profiler()
+
+
 # --- 3. Инициализация клиентов ---
-try:
-    client = TelegramClient(SESSION_NAME, int(API_ID), API_HASH)
-    logger.info("Клиент Telethon инициализирован.")
-
-    session = HTTP(
-        testnet=False,
-        demo=True,
-        api_key=BYBIT_API_KEY,
-        api_secret=BYBIT_API_SECRET,
-    )
-    logger.info("Клиент Bybit инициализирован.")
-except Exception as e:
-    logger.error(f"Ошибка при инициализации клиентов: {e}")
-    raise SystemExit(1)
+# Клиенты создаются в том процессе, который ими пользуется (см. BOT_MODE)
+client = None
+accounts = []
+
+
+class FileStringSession(StringSession):
+    """StringSession в памяти, которая сохраняется в JSON-файл при изменении.
+
+    Помимо строки сессии в файле хранятся резолвнутые целевые каналы, чтобы
+    не искать их заново при каждом старте. Кэш сущностей ограничен
+    ``entity_limit`` строками: при переполнении вытесняются самые давние,
+    целевые каналы и строка собственного аккаунта (id=0) не вытесняются.
+
+    Состояние апдейтов (pts/qts/seq) в файл не пишется, поэтому
+    ``catch_up`` Telethon после рестарта догонять не от чего. Бот на него и
+    не полагается: после failover пропущенные сообщения дочитываются из
+    истории каналов (см. catch_up_channels).
+    """
+
+    def __init__(self, path, entity_limit=TELEGRAM_ENTITY_CACHE_LIMIT):
+        data = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        super().__init__(data.get("session") or None)
+        # dict вместо set: порядок вставки — возраст строки для вытеснения
+        self._entities = {}
+        self.path = path
+        self.entity_limit = entity_limit
+        self.channels = data.get("channels", {})
+        self._saved = data.get("session", "")
+        for marked_id, access_hash in self.channels.values():
+            row = self._entity_values_to_row(marked_id, access_hash, None, None, None)
+            self._entities[row] = None
+
+    @classmethod
+    def from_sqlite(cls, path, session_name):
+        # одноразовая миграция авторизации из SQLite-сессии (без кэша сущностей)
+        session = cls(path)
+        if not session.auth_key and os.path.exists(f"{session_name}.session"):
+            sqlite = SQLiteSession(session_name)
+            session.set_dc(sqlite.dc_id, sqlite.server_address, sqlite.port)
+            session.auth_key = sqlite.auth_key
+            sqlite.close()
+            session.save()
+            logger.info(f"Сессия {session_name}.session перенесена в {path}.")
+        return session
+
+    def pinned_ids(self):
+        ids = {marked_id for marked_id, _ in self.channels.values()}
+        # Telethon хранит себя строкой с id=0 и собственным id вместо access_hash
+        ids.add(0)
+        ids.update(row[1] for row in self._entities if row[0] == 0)
+        return ids
+
+    def remember_channel(self, key, peer):
+        self.channels[str(key)] = [utils.get_peer_id(peer), peer.access_hash]
+        self._persist(super().save())
+
+    def get_channel_peer(self, key):
+        cached = self.channels.get(str(key))
+        if cached is None:
+            return None
+        marked_id, access_hash = cached
+        return types.InputPeerChannel(utils.resolve_id(marked_id)[0], access_hash)
+
+    def process_entities(self, tlo):
+        rows = self._entities_to_rows(tlo)
+        if not rows:
+            return
+        # новые строки заменяют старые с тем же id и встают в конец очереди
+        ids = {row[0] for row in rows}
+        for row in [row for row in self._entities if row[0] in ids]:
+            del self._entities[row]
+        pinned = self.pinned_ids() | {row[1] for row in rows if row[0] == 0}
+        overflow = len(self._entities) + len(rows) - self.entity_limit
+        if overflow > 0:
+            evict = [row for row in self._entities if row[0] not in pinned]
+            for row in evict[:overflow]:
+                del self._entities[row]
+        for row in rows:
+            if row[0] in pinned or len(self._entities) < self.entity_limit:
+                self._entities[row] = None
+
+    def save(self):
+        value = super().save()
+        if value and value != self._saved:
+            self._persist(value)
+        return value
+
+    def _persist(self, value):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"session": value, "channels": self.channels}, f)
+        os.replace(tmp_path, self.path)
+        self._saved = value
+
+
+class ChannelScopedClient(TelegramClient):
+    """TelegramClient, отбрасывающий апдейты чужих чатов до сборки событий.
+
+    Вместе с апдейтами отбрасываются и сущности чужих чатов, чтобы они не
+    копились во внутреннем кэше Telethon и не вызывали его сброс в сессию.
+    """
+
+    channel_ids = None
+
+    def _preprocess_updates(self, updates, users, chats):
+        if self.channel_ids is not None:
+            updates = [u for u in updates if self._is_target_update(u)]
+            peers = self.channel_ids | {
+                utils.get_peer_id(u.message.from_id)
+                for u in updates
+                if getattr(u.message, "from_id", None) is not None
+            }
+            users = [x for x in users if utils.get_peer_id(x) in peers]
+            chats = [x for x in chats if utils.get_peer_id(x) in peers]
+        return super()._preprocess_updates(updates, users, chats)
+
+    def _is_target_update(self, update):
+        message = getattr(update, "message", None)
+        peer = getattr(message, "peer_id", None)
+        if peer is None:
+            return False
+        return utils.get_peer_id(peer) in self.channel_ids
+
+
+async def resolve_channels(client, channels):
+    """Резолвит каналы один раз; в lean-режиме результат кэшируется в сессии."""
+    if not isinstance(client, ChannelScopedClient):
+        return channels
+    resolved = []
+    for channel in channels:
+        peer = client.session.get_channel_peer(channel)
+        if peer is None:
+            peer = await lookup_input_channel(client, channel)
+            client.session.remember_channel(channel, peer)
+        resolved.append(utils.get_peer_id(peer))
+    client.channel_ids = set(resolved)
+    logger.info(f"Целевые каналы: {resolved}")
+    return resolved
+
+
+async def lookup_input_channel(client, channel):
+    try:
+        return await client.get_input_entity(channel)
+    except ValueError:
+        # в пустом кэше канал по ID не найти — ищем один раз среди диалогов
+        async for dialog in client.iter_dialogs():
+            if dialog.id == channel or (
+                isinstance(channel, str)
+                and getattr(dialog.entity, "username", None) == channel.lstrip("@")
+            ):
+                return dialog.input_entity
+        raise
+
+
+def init_telegram_client(session_name=None, **kwargs):
+    global client
+    session_name = session_name or SESSION_NAME
+    try:
+        if TELEGRAM_LEAN_SESSION:
+            client = ChannelScopedClient(
+                FileStringSession.from_sqlite(
+                    f"{session_name}.session.json", session_name
+                ),
+                int(API_ID),
+                API_HASH,
+                **kwargs,
+            )
+        else:
+            client = TelegramClient(session_name, int(API_ID), API_HASH, **kwargs)
+        logger.info("Клиент Telethon инициализирован.")
+    except Exception as e:
+        logger.error(f"Ошибка при инициализации клиента Telethon: {e}")
+        raise SystemExit(1)
+    return client
+
+
+def init_accounts():
+    global accounts
+    try:
+        accounts = load_accounts()
+        for account in accounts:
+            account.connect()
+            account.risk.bootstrap(load_positions(account), account.trades_csv)
+        logger.info(f"Клиенты Bybit инициализированы: {[a.name for a in accounts]}")
+    except Exception as e:
+        logger.error(f"Ошибка при инициализации клиентов Bybit: {e}")
+        raise SystemExit(1)
+    return accounts
 
 
 # --- 4. Парсер сигналов ---
@@ -352,7 +1133,7 @@ def get_order_id_from_response(response):
     return ""
 
 
-def get_exec_price_from_response_or_market(response, symbol):
+def get_exec_price_from_response_or_market(session, response, symbol):
     price_candidates = [
         "avgPrice",
         "avgprice",
@@ -381,6 +1162,10 @@ def get_exec_price_from_response_or_market(response, symbol):
         if total_qty > 0:
             return (total_notional / total_qty).quantize(Decimal("0.00000001"))
 
+    return fetch_last_price(session, symbol)
+
+
+def fetch_last_price(session, symbol):
     try:
         ticker = session.get_tickers(category="spot", symbol=symbol)
         tlist = ticker.get("result", {}).get("list", [])
@@ -400,7 +1185,18 @@ def get_exec_price_from_response_or_market(response, symbol):
 
 
 # --- получить баланс USDT ---
-def get_usdt_balance():
+def get_usdt_balance(account, adapter):
+    # кэш на BALANCE_CACHE_TTL секунд, сбрасывается после каждого ордера
+    now = time.monotonic()
+    cached = account._balances_usdt.get(adapter.name)
+    if cached is not None and now - cached[1] < BALANCE_CACHE_TTL:
+        return cached[0]
+    balance = adapter.get_usdt_balance()
+    account._balances_usdt[adapter.name] = (balance, now)
+    return balance
+
+
+def fetch_usdt_balance(session):
     try:
         resp = session.get_wallet_balance(accountType="UNIFIED", coin="USDT")
         logger.debug("get_wallet_balance(UNIFIED) response: %s", resp)
@@ -488,12 +1284,14 @@ def get_usdt_balance():
 
 
 # --- qty precision / local base qty ---
-def get_local_long_qty(symbol):
-    positions = load_positions()
+def get_local_long_qty(account, symbol, venue=None):
+    positions = load_positions(account)
     pos = positions.get(symbol, {})
     longs = pos.get("longs", [])
     total = Decimal("0")
     for l in longs:
+        if venue is not None and lot_venue(l) != venue:
+            continue
         try:
             total += to_decimal(l.get("qty", "0"))
         except Exception:
@@ -501,7 +1299,7 @@ def get_local_long_qty(symbol):
     return total
 
 
-def get_base_balance_from_api(symbol):
+def get_base_balance_from_api(session, symbol):
     base = symbol.replace("USDT", "")
     try:
         resp = session.get_wallet_balance(accountType="SPOT", coin=base)
@@ -523,21 +1321,227 @@ def get_base_balance_from_api(symbol):
     return Decimal("0")
 
 
-def get_precision_for_symbol(symbol: str) -> int:
-    return SPOT_DECIMALS.get(symbol.upper(), DEFAULT_BASE_PRECISION)
+def get_precision_for_symbol(symbol: str, adapter=None) -> int:
+    symbol = symbol.upper()
+    if symbol in SPOT_DECIMALS:
+        return SPOT_DECIMALS[symbol]
+    if adapter is not None:
+        precision = adapter.get_instrument_info(symbol).get("base_precision")
+        if precision is not None:
+            return precision
+    return DEFAULT_BASE_PRECISION
+
+
+def precision_from_step(step):
+    step = to_decimal(step)
+    if step <= 0:
+        return None
+    return max(0, -step.normalize().as_tuple().exponent)
+
+
+# --- Адаптеры бирж ---
+class ExchangeAdapter(ABC):
+    """Интерфейс биржи: баланс, рыночный ордер, fills и параметры инструмента."""
+
+    name = "base"
+
+    @abstractmethod
+    def get_usdt_balance(self):
+        pass
+
+    @abstractmethod
+    def get_base_balance(self, symbol):
+        pass
+
+    @abstractmethod
+    def get_last_price(self, symbol):
+        pass
+
+    @abstractmethod
+    def get_instrument_info(self, symbol):
+        pass
+
+    @abstractmethod
+    def place_market_order(self, symbol, side, qty, quote_qty=False):
+        pass
+
+    def extract_fills(self, response):
+        return extract_fills_from_response(response)
+
+    def get_order_id(self, response):
+        return get_order_id_from_response(response)
+
+    @abstractmethod
+    def get_exec_price(self, response, symbol):
+        pass
+
+
+class BybitAdapter(ExchangeAdapter):
+    name = "bybit"
+
+    def __init__(self, session):
+        self.session = session
+        self._instruments = {}
+
+    def get_usdt_balance(self):
+        return fetch_usdt_balance(self.session)
+
+    def get_base_balance(self, symbol):
+        return get_base_balance_from_api(self.session, symbol)
+
+    def get_last_price(self, symbol):
+        return fetch_last_price(self.session, symbol)
+
+    def get_instrument_info(self, symbol):
+        info = self._instruments.get(symbol)
+        if info is not None:
+            return info
+        info = {}
+        try:
+            resp = self.session.get_instruments_info(category="spot", symbol=symbol)
+            lst = resp.get("result", {}).get("list", [])
+            if lst:
+                lot = lst[0].get("lotSizeFilter", {})
+                info["base_precision"] = precision_from_step(
+                    lot.get("basePrecision", "0")
+                )
+                info["min_order_qty"] = to_decimal(lot.get("minOrderQty", "0"))
+        except Exception as e:
+            logger.debug(f"Не удалось получить параметры инструмента {symbol}: {e}")
+            return info
+        self._instruments[symbol] = info
+        return info
+
+    def place_market_order(self, symbol, side, qty, quote_qty=False):
+        params = dict(
+            category="spot",
+            symbol=symbol,
+            side=side,
+            orderType="Market",
+            qty=str(qty),
+        )
+        if quote_qty:
+            params["marketUnit"] = "quoteCoin"
+        return self.session.place_order(**params)
+
+    def get_exec_price(self, response, symbol):
+        return get_exec_price_from_response_or_market(self.session, response, symbol)
+
+
+def create_bybit_adapter(account):
+    return BybitAdapter(
+        HTTP(
+            testnet=False,
+            demo=True,
+            api_key=account.api_key,
+            api_secret=account.api_secret,
+        )
+    )
+
+
+EXCHANGE_ADAPTERS = {
+    "bybit": create_bybit_adapter,
+}
 
 
-def close_spot_position(symbol):
+class ExchangeRouter:
+    """Выбирает биржу для ордера по кэшированной цене или измеренной задержке."""
+
+    def __init__(self, adapters, mode=None, price_ttl=None):
+        self.adapters = list(adapters)
+        self.mode = mode or ROUTING_MODE
+        self.price_ttl = PRICE_CACHE_TTL if price_ttl is None else price_ttl
+        # (venue, symbol) -> (цена, время получения)
+        self._prices = {}
+        # venue -> EMA задержки запросов в секундах
+        self._latency = {}
+        self._pool = None
+        if len(self.adapters) > 1:
+            self._pool = ThreadPoolExecutor(
+                max_workers=len(self.adapters), thread_name_prefix="router"
+            )
+
+    def record_latency(self, venue, seconds):
+        prev = self._latency.get(venue)
+        self._latency[venue] = seconds if prev is None else prev * 0.8 + seconds * 0.2
+
+    def get_latency(self, venue):
+        return self._latency.get(venue, float("inf"))
+
+    def quote(self, adapter, symbol, refresh=False):
+        now = time.monotonic()
+        cached = self._prices.get((adapter.name, symbol))
+        if cached is not None and not refresh and now - cached[1] < self.price_ttl:
+            return cached[0]
+        try:
+            price = adapter.get_last_price(symbol)
+        except Exception as e:
+            logger.debug(f"{adapter.name}: не удалось получить цену {symbol}: {e}")
+            price = Decimal("0")
+        done = time.monotonic()
+        self.record_latency(adapter.name, done - now)
+        self._prices[(adapter.name, symbol)] = (price, done)
+        return price
+
+    def rank(self, symbol, side, candidates=None):
+        """Биржи от лучшей к худшей: по цене (Buy — дешевле, Sell — дороже)
+        или по задержке; биржи без цены идут в конце."""
+        candidates = list(candidates or self.adapters)
+        if len(candidates) == 1:
+            return candidates
+        quotes = list(self._pool.map(lambda a: self.quote(a, symbol), candidates))
+        if self.mode == "latency":
+            return sorted(candidates, key=lambda a: self.get_latency(a.name))
+        priced = [(p, a) for p, a in zip(quotes, candidates) if p > 0]
+        priced.sort(key=lambda pa: pa[0], reverse=side != "Buy")
+        unpriced = [a for p, a in zip(quotes, candidates) if p <= 0]
+        return [a for _, a in priced] + unpriced
+
+    def select(self, symbol, side, candidates=None):
+        return self.rank(symbol, side, candidates)[0]
+
+    def place_market_order(self, adapter, symbol, side, qty, quote_qty=False):
+        started = time.monotonic()
+        try:
+            return adapter.place_market_order(symbol, side, qty, quote_qty=quote_qty)
+        finally:
+            self.record_latency(adapter.name, time.monotonic() - started)
+
+
+def close_spot_position(account, symbol, adapter=None):
+    log = account.logger
+    if adapter is None:
+        # спот можно продать только там, где куплен: закрываем на каждой бирже
+        # с локальными лонгами, а без них — на бирже, выбранной роутером
+        holding = [
+            a
+            for a in account.adapters
+            if get_local_long_qty(account, symbol, a.name) > 0
+        ]
+        if not holding and len(account.adapters) > 1:
+            # локальных лотов нет — ищем биржи, где монета реально лежит
+            with span("balance"):
+                holding = [
+                    a
+                    for a in account.router.rank(symbol, "Sell")
+                    if a.get_base_balance(symbol) > 0
+                ]
+        if len(holding) > 1:
+            for a in holding:
+                close_spot_position(account, symbol, a)
+            return
+        with span("route"):
+            adapter = holding[0] if holding else account.router.select(symbol, "Sell")
     try:
-        base_qty = get_local_long_qty(symbol)
+        base_qty = get_local_long_qty(account, symbol, adapter.name)
         if base_qty <= 0:
-            base_qty = get_base_balance_from_api(symbol)
+            with span("balance"):
+                base_qty = adapter.get_base_balance(symbol)
 
         if base_qty <= 0:
-            logger.info(
-                f"Нет лонгов для {symbol} (локально и в API) — нечего закрывать."
-            )
+            log.info(f"Нет лонгов для {symbol} (локально и в API) — нечего закрывать.")
             write_trade_row(
+                account,
                 [
                     datetime.now(timezone.utc).isoformat(),
                     symbol,
@@ -549,37 +1553,38 @@ def close_spot_position(symbol):
                     "",
                     "",
                     "nothing_to_close",
-                ]
+                ],
             )
             return
 
-        precision = get_precision_for_symbol(symbol)
+        precision = get_precision_for_symbol(symbol, adapter)
         base_qty = round_down_decimal(base_qty, precision)
         if base_qty <= 0:
-            logger.info(
-                f"После округления qty={base_qty} — ничтожно, не отправляю ордер."
-            )
+            log.info(f"После округления qty={base_qty} — ничтожно, не отправляю ордер.")
             return
 
-        logger.info(
-            f"Попытка закрыть спот-лонг: {symbol}, qty={base_qty} (market sell) with precision={precision}"
-        )
+        if reject_by_risk(account, symbol, "Sell", None):
+            return
 
-        response = session.place_order(
-            category="spot",
-            symbol=symbol,
-            side="Sell",
-            orderType="Market",
-            qty=str(base_qty),
+        log.info(
+            f"Попытка закрыть спот-лонг: {symbol} на {adapter.name}, qty={base_qty} (market sell) with precision={precision}"
         )
 
-        logger.debug(f"Ответ Bybit на close (raw): {response}")
+        with span("order"):
+            response = account.router.place_market_order(
+                adapter, symbol, "Sell", base_qty
+            )
+        account.invalidate_balance(adapter.name)
+
+        log.debug(f"Ответ {adapter.name} на close (raw): {response}")
 
-        order_id = get_order_id_from_response(response)
-        fills = extract_fills_from_response(response)
+        with span("decode"):
+            order_id = adapter.get_order_id(response)
+            fills = adapter.extract_fills(response)
 
         if not fills:
-            exec_price = get_exec_price_from_response_or_market(response, symbol)
+            with span("decode"):
+                exec_price = adapter.get_exec_price(response, symbol)
             fills = [
                 {
                     "price": exec_price,
@@ -588,15 +1593,18 @@ def close_spot_position(symbol):
                     "order_id": order_id,
                 }
             ]
-            logger.debug("Fallback fill created for close_spot_position.")
+            log.debug("Fallback fill created for close_spot_position.")
 
         for f in fills:
             price = f["price"]
             qty = f["qty"]
             fee = f.get("fee", Decimal("0"))
             order_id = f.get("order_id") or order_id or ""
-            realized = update_positions_and_compute_pnl(symbol, "Sell", price, qty, fee)
+            realized = update_positions_and_compute_pnl(
+                account, symbol, "Sell", price, qty, fee, adapter.name
+            )
             write_trade_row(
+                account,
                 [
                     datetime.now(timezone.utc).isoformat(),
                     symbol,
@@ -608,15 +1616,16 @@ def close_spot_position(symbol):
                     "USDT",
                     str(realized),
                     "closed_by_signal",
-                ]
+                ],
             )
-            logger.info(
+            log.info(
                 f"Closed logged: {symbol} qty={qty} price={price} realized={realized}"
             )
 
     except Exception as e:
-        logger.error(f"Ошибка при попытке закрыть позицию {symbol}: {e}")
+        log.error(f"Ошибка при попытке закрыть позицию {symbol}: {e}")
         write_trade_row(
+            account,
             [
                 datetime.now(timezone.utc).isoformat(),
                 symbol,
@@ -628,30 +1637,48 @@ def close_spot_position(symbol):
                 "",
                 "",
                 f"close_error: {e}",
-            ]
+            ],
         )
 
 
+def select_buy_venue(account, symbol):
+    # лучшая по роутеру биржа, где хватает USDT на TRADE_AMOUNT_USD,
+    # иначе — биржа с наибольшим балансом
+    best = None
+    for adapter in account.router.rank(symbol, "Buy"):
+        with span("balance"):
+            balance = get_usdt_balance(account, adapter)
+        if balance >= TRADE_AMOUNT_USD:
+            return adapter, balance
+        if best is None or balance > best[1]:
+            best = (adapter, balance)
+    return best
+
+
 # --- 5. Функция для размещения ордера (Buy и Sell обработка) ---
-def place_order_on_bybit(signal_data):
+@profiled
+def place_order_on_bybit(account, signal_data):
+    log = account.logger
     try:
         symbol = signal_data["symbol"].upper()
         side = signal_data["side"].capitalize()
 
         if symbol not in SPOT_SYMBOLS:
-            logger.warning(
+            log.warning(
                 f"Сигнал по {symbol} — инструмент не в списке SPOT_SYMBOLS, игнорирую."
             )
             return
 
         if side == "Buy":
-            balance_usdt = get_usdt_balance()
-            logger.info(f"Баланс USDT (доступный): {balance_usdt}")
+            with span("route"):
+                adapter, balance_usdt = select_buy_venue(account, symbol)
+            log.info(f"Баланс USDT на {adapter.name} (доступный): {balance_usdt}")
 
             desired = TRADE_AMOUNT_USD
             if balance_usdt <= 0:
-                logger.warning("Баланс USDT нулевой — не размещаю ордер.")
+                log.warning("Баланс USDT нулевой — не размещаю ордер.")
                 write_trade_row(
+                    account,
                     [
                         datetime.now(timezone.utc).isoformat(),
                         symbol,
@@ -663,41 +1690,44 @@ def place_order_on_bybit(signal_data):
                         "",
                         "",
                         "no_balance",
-                    ]
+                    ],
                 )
                 return
 
             if balance_usdt < desired:
                 amount_usdt = (balance_usdt * Decimal("0.99")).quantize(Decimal("0.01"))
-                logger.info(
+                log.info(
                     f"Баланс меньше {desired}$ — установлено amount_usdt = {amount_usdt}"
                 )
             else:
                 amount_usdt = desired
 
-            logger.info(
-                f"Попытка Market Buy (spot) {symbol} за {amount_usdt} USDT (marketUnit=quoteCoin)"
-            )
-            response = session.place_order(
-                category="spot",
-                symbol=symbol,
-                side="Buy",
-                orderType="Market",
-                qty=str(amount_usdt),
-                marketUnit="quoteCoin",
+            if reject_by_risk(account, symbol, "Buy", amount_usdt):
+                return
+
+            log.info(
+                f"Попытка Market Buy (spot) {symbol} на {adapter.name} за {amount_usdt} USDT (marketUnit=quoteCoin)"
             )
-            logger.debug(f"Ответ Bybit (raw): {response}")
+            with span("order"):
+                response = account.router.place_market_order(
+                    adapter, symbol, "Buy", amount_usdt, quote_qty=True
+                )
+            account.invalidate_balance(adapter.name)
+            log.debug(f"Ответ {adapter.name} (raw): {response}")
 
-            order_id = get_order_id_from_response(response)
-            fills = extract_fills_from_response(response)
+            with span("decode"):
+                order_id = adapter.get_order_id(response)
+                fills = adapter.extract_fills(response)
 
             if not fills:
-                exec_price = get_exec_price_from_response_or_market(response, symbol)
+                with span("decode"):
+                    exec_price = adapter.get_exec_price(response, symbol)
                 if exec_price == 0:
-                    logger.warning(
+                    log.warning(
                         "Не удалось определить цену исполнения (market) — логирую без fills."
                     )
                     write_trade_row(
+                        account,
                         [
                             datetime.now(timezone.utc).isoformat(),
                             symbol,
@@ -709,14 +1739,14 @@ def place_order_on_bybit(signal_data):
                             "",
                             "",
                             "no_fills_no_price",
-                        ]
+                        ],
                     )
                     return
                 try:
                     raw_base_qty = to_decimal(amount_usdt) / exec_price
                 except Exception:
                     raw_base_qty = Decimal("0")
-                precision = get_precision_for_symbol(symbol)
+                precision = get_precision_for_symbol(symbol, adapter)
                 base_qty = round_down_decimal(raw_base_qty, precision)
                 fills = [
                     {
@@ -726,7 +1756,7 @@ def place_order_on_bybit(signal_data):
                         "order_id": order_id or "",
                     }
                 ]
-                logger.debug("Fallback fill created for Buy.")
+                log.debug("Fallback fill created for Buy.")
 
             for f in fills:
                 price = f["price"]
@@ -734,9 +1764,10 @@ def place_order_on_bybit(signal_data):
                 fee = f.get("fee", Decimal("0"))
                 order_id = f.get("order_id") or order_id or ""
                 realized = update_positions_and_compute_pnl(
-                    symbol, "Buy", price, qty, fee
+                    account, symbol, "Buy", price, qty, fee, adapter.name
                 )
                 write_trade_row(
+                    account,
                     [
                         datetime.now(timezone.utc).isoformat(),
                         symbol,
@@ -748,22 +1779,23 @@ def place_order_on_bybit(signal_data):
                         "USDT",
                         str(realized),
                         "ok",
-                    ]
+                    ],
                 )
-                logger.info(
+                log.info(
                     f"Exec logged: symbol={symbol} side=Buy price={price} qty={qty} realized_pnl={realized}"
                 )
 
         elif side == "Sell":
-            close_spot_position(symbol)
+            close_spot_position(account, symbol)
 
         else:
-            logger.warning(f"Неизвестный side={side} — игнор.")
+            log.warning(f"Неизвестный side={side} — игнор.")
             return
 
     except Exception as e:
-        logger.exception(f"Ошибка при размещении ордера на Bybit: {e}")
+        log.exception(f"Ошибка при размещении ордера: {e}")
         write_trade_row(
+            account,
             [
                 datetime.now(timezone.utc).isoformat(),
                 signal_data.get("symbol", ""),
@@ -775,36 +1807,561 @@ def place_order_on_bybit(signal_data):
                 "",
                 "",
                 f"place_order_error: {e}",
-            ]
+            ],
+        )
+
+
+# --- Fan-out сигнала на все аккаунты ---
+_fanout_pool = None
+
+
+def place_order_for_account(account, signal_data):
+    with span(f"account {account.name}"):
+        place_order_on_bybit(account, signal_data)
+
+
+def dispatch_signal(signal_data):
+    global _fanout_pool
+    if len(accounts) == 1:
+        place_order_for_account(accounts[0], signal_data)
+        return
+    if _fanout_pool is None:
+        _fanout_pool = ThreadPoolExecutor(
+            max_workers=len(accounts), thread_name_prefix="account"
         )
+    # каждый аккаунт получает свою копию сигнала, ждём завершения всех ордеров
+    # copy_context переносит текущий спан трассировки в потоки пула
+    futures = [
+        _fanout_pool.submit(
+            contextvars.copy_context().run,
+            place_order_for_account,
+            account,
+            dict(signal_data),
+        )
+        for account in accounts
+    ]
+    for future in futures:
+        future.result()
 
 
 # --- 6. Обработчик сообщений ---
-try:
-    target_channel = int(TELEGRAM_CHANNEL_ID)
-except Exception:
-    target_channel = TELEGRAM_CHANNEL_ID
+def parse_channel_id(value):
+    try:
+        return int(value)
+    except Exception:
+        return value
+
+
+target_channels = [
+    parse_channel_id(c.strip())
+    for c in (TELEGRAM_CHANNEL_ID or "").split(",")
+    if c.strip()
+]
+
+
+# chat_id -> id последнего обработанного сообщения. Хранится в LAST_MESSAGES_JSON
+# и реплицируется на standby, чтобы после failover не исполнить повторно
+# сообщения, дочитанные catch_up_channels()
+last_message_ids = {}
+
+
+def load_last_message_ids():
+    if os.path.exists(LAST_MESSAGES_JSON):
+        with open(LAST_MESSAGES_JSON, "r", encoding="utf-8") as f:
+            last_message_ids.update({int(k): v for k, v in json.load(f).items()})
+    return last_message_ids
+
+
+def save_last_message_ids():
+    tmp_path = f"{LAST_MESSAGES_JSON}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(last_message_ids, f)
+    os.replace(tmp_path, LAST_MESSAGES_JSON)
+
+
+def mark_message_processed(chat_id, message_id):
+    if message_id <= last_message_ids.get(chat_id, 0):
+        return False
+    last_message_ids[chat_id] = message_id
+    save_last_message_ids()
+    replicate("message", chat_id, message_id)
+    return True
+
+
+# пока идёт catch_up_channels, живые сообщения копятся здесь: иначе новое
+# сообщение подняло бы last_message_ids выше ещё не дочитанных
+pending_messages = None
+
+
+async def catch_up_channels(client, chats):
+    """Дочитывает сообщения, пришедшие в каналы во время failover.
+
+    Вызывается после регистрации обработчика и только при переходе
+    standby -> active. Канал без сохранённого last_message_ids ещё ни разу не
+    обрабатывался: его история не исполняется, запоминается только последний id.
+    Живые сообщения, полученные во время дочитывания, исполняются после него.
+    """
+    global pending_messages
+    pending_messages = []
+    try:
+        for chat in chats:
+            latest = await client.get_messages(chat, limit=1)
+            if not latest:
+                continue
+            chat_id = latest[0].chat_id
+            last_id = last_message_ids.get(chat_id)
+            if last_id is None:
+                mark_message_processed(chat_id, latest[0].id)
+                continue
+            missed = 0
+            async for message in client.iter_messages(
+                chat, min_id=last_id, reverse=True
+            ):
+                process_message(chat_id, message)
+                missed += 1
+            logger.info(
+                f"Catch-up {chat_id}: дочитано сообщений после {last_id}: {missed}"
+            )
+    finally:
+        buffered, pending_messages = pending_messages, None
+        for chat_id, message in sorted(buffered, key=lambda item: item[1].id):
+            process_message(chat_id, message)
 
 
-@client.on(events.NewMessage(chats=target_channel))
 async def handler(event):
-    message_text = event.message.text or ""
+    if pending_messages is not None:
+        pending_messages.append((event.chat_id, event.message))
+        return
+    process_message(event.chat_id, event.message)
+
+
+def process_message(chat_id, message):
+    if not mark_message_processed(chat_id, message.id):
+        logger.info(f"Сообщение {message.id} уже обработано — пропускаю.")
+        return
+    message_text = message.text or ""
     logger.info("Получено новое сообщение из канала.")
-    signal = parse_signal(message_text)
-    if signal:
-        place_order_on_bybit(signal)
-    else:
+    with signal_trace():
+        with span("parse"):
+            signal = parse_signal(message_text)
+        if signal:
+            dispatch_signal(signal)
+        else:
+            logger.warning(
+                f"Сообщение не является торговым сигналом или не соответствует шаблону. Результат парсинга (signal): {signal}"
+            )
+
+
+# --- 7. Многопроцессный режим: listener-процессы -> очередь -> executor ---
+# Listener только парсит сообщения и пересылает компактную запись сигнала,
+# executor владеет сессиями pybit, книгами позиций и журналами сделок.
+def signal_to_record(signal):
+    return (signal["symbol"], signal["side"], signal["price"], time.time())
+
+
+def record_to_signal(record):
+    symbol, side, price, received_at = record
+    return {
+        "symbol": symbol,
+        "side": side,
+        "price": price,
+        "received_at": received_at,
+    }
+
+
+def listener_session_name(index):
+    return SESSION_NAME if index == 0 else f"{SESSION_NAME}_{index}"
+
+
+def split_channels(channels, groups):
+    buckets = [[] for _ in range(min(groups, len(channels)) or 1)]
+    for i, channel in enumerate(channels):
+        buckets[i % len(buckets)].append(channel)
+    return buckets
+
+
+def listener_process(index, channels, queue):
+    init_telegram_client(listener_session_name(index))
+
+    async def forward(event):
+        signal = parse_signal(event.message.text or "")
+        if signal:
+            # не блокируем event loop: при переполненной очереди сигнал теряется
+            try:
+                queue.put_nowait(signal_to_record(signal))
+            except Full:
+                logger.error(
+                    f"Очередь сигналов переполнена ({SIGNAL_QUEUE_SIZE}) — "
+                    f"сигнал {signal['symbol']} {signal['side']} потерян."
+                )
+        else:
+            logger.debug("Сообщение не является торговым сигналом — не пересылаю.")
+
+    async def run():
+        await client.connect()
+        if not await client.is_user_authorized():
+            logger.error(
+                f"Сессия {listener_session_name(index)} не авторизована — "
+                "запустите бота один раз в режиме single с этой SESSION_NAME."
+            )
+            return
+        chats = await resolve_channels(client, channels)
+        client.add_event_handler(forward, events.NewMessage(chats=chats))
+        logger.info(f"Listener #{index} слушает каналы: {channels}")
+        await client.run_until_disconnected()
+
+    client.loop.run_until_complete(run())
+
+
+def executor_process(queue):
+    # Ctrl+C получает вся группа процессов: executor не прерываем посреди
+    # ордера, его останавливает маркер None от родителя после дренажа очереди
+    signals.signal(signals.SIGINT, signals.SIG_IGN)
+    init_accounts()
+    profiler.watch()
+    logger.info("Executor запущен и ожидает сигналы из очереди...")
+    while True:
+        record = queue.get()
+        if record is None:
+            break
+        signal = record_to_signal(record)
+        logger.info(
+            f"Сигнал из очереди: {signal['symbol']} {signal['side']} "
+            f"(задержка {time.time() - signal['received_at']:.3f}s)"
+        )
+        with signal_trace():
+            dispatch_signal(signal)
+    logger.info("Executor остановлен.")
+
+
+def run_split():
+    if not target_channels:
+        logger.error("TELEGRAM_CHANNEL_ID не задан — нечего слушать.")
+        return
+    queue = multiprocessing.Queue(maxsize=SIGNAL_QUEUE_SIZE)
+    executor = multiprocessing.Process(
+        target=executor_process, args=(queue,), name="executor"
+    )
+    listeners = [
+        multiprocessing.Process(
+            target=listener_process,
+            args=(i, channels, queue),
+            name=f"listener-{i}",
+            daemon=True,
+        )
+        for i, channels in enumerate(
+            split_channels(target_channels, LISTENER_PROCESSES)
+        )
+    ]
+    executor.start()
+    for p in listeners:
+        p.start()
+    try:
+        while executor.is_alive() and any(p.is_alive() for p in listeners):
+            executor.join(timeout=1)
+        if not executor.is_alive():
+            logger.error(
+                f"Executor завершился (exitcode={executor.exitcode}) — "
+                "останавливаю listener-процессы."
+            )
+    except KeyboardInterrupt:
+        logger.info("Остановка listener-процессов...")
+    finally:
+        for p in listeners:
+            if p.is_alive():
+                p.terminate()
+        if executor.is_alive():
+            queue.put(None)
+            executor.join()
+
+
+# --- 8. Hot-standby: lease, репликация состояния, прогрев ---
+class FileLease:
+    """Эксклюзивная блокировка файла; ОС снимает её, если владелец умер."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def try_acquire(self):
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}\n".encode())
+        self._fd = fd
+        return True
+
+
+def parse_address(value):
+    host, _, port = value.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def build_replica_snapshot():
+    # вызывается под account.lock всех аккаунтов (см. ReplicationServer)
+    return {
+        "accounts": [
+            {
+                "name": account.name,
+                "positions_json": os.path.realpath(account.positions_json),
+                "trades_csv": os.path.realpath(account.trades_csv),
+                "positions": load_positions(account),
+                "daily_realized": str(account.risk.daily_realized),
+            }
+            for account in accounts
+        ],
+        "last_messages_json": os.path.realpath(LAST_MESSAGES_JSON),
+        "last_message_ids": dict(last_message_ids),
+    }
+
+
+class ReplicationServer:
+    """Активный узел: отправляет снимок и поток изменений подключённым standby.
+
+    publish() только сериализует запись и кладёт её в очередь, в сокеты пишет
+    отдельный поток: медленный standby не задерживает ордера. Снимок для
+    нового standby сериализуется сразу при подключении, под блокировками
+    всех книг позиций, и ставится в ту же очередь. Изменение позиции
+    публикуется под блокировкой своей книги, поэтому оно попадает либо в
+    снимок, либо в поток после него, но не туда и туда.
+    """
+
+    def __init__(self, address, authkey):
+        self._listener = Listener(address, authkey=authkey)
+        self._conns = []
+        self._queue = Queue()
+        threading.Thread(
+            target=self._accept_loop, name="replication-accept", daemon=True
+        ).start()
+        threading.Thread(
+            target=self._send_loop, name="replication", daemon=True
+        ).start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn = self._listener.accept()
+            except Exception as e:
+                logger.warning(f"Репликация: не удалось принять standby: {e}")
+                continue
+            with contextlib.ExitStack() as stack:
+                for account in accounts:
+                    stack.enter_context(account.lock)
+                snapshot = pickle.dumps(("snapshot", build_replica_snapshot()))
+                self._queue.put((conn, snapshot))
+
+    def _send_loop(self):
+        while True:
+            item = self._queue.get()
+            if isinstance(item, bytes):
+                for conn in list(self._conns):
+                    try:
+                        conn.send_bytes(item)
+                    except Exception:
+                        logger.warning("Репликация: standby отключился.")
+                        self._conns.remove(conn)
+                        conn.close()
+                continue
+            conn, snapshot = item
+            try:
+                conn.send_bytes(snapshot)
+            except Exception as e:
+                logger.warning(f"Репликация: не удалось отправить снимок: {e}")
+                conn.close()
+                continue
+            self._conns.append(conn)
+            logger.info("Репликация: standby подключён.")
+
+    def publish(self, record):
+        # сериализуем сразу, пока запись соответствует текущему состоянию
+        self._queue.put(pickle.dumps(record))
+
+
+class ReplicaFollower(threading.Thread):
+    """Standby: держит в памяти копию книги позиций активного узла."""
+
+    def __init__(self, address, authkey):
+        super().__init__(name="replica", daemon=True)
+        self.address = address
+        self.authkey = authkey
+        self._stop_event = threading.Event()
+        # аккаунты, чьи файлы не совпадают с файлами активного узла
+        self._write_files = set()
+        self._write_messages = False
+
+    def stop(self):
+        self._stop_event.set()
+
+    def reload_shared_files(self):
+        # активный узел пишет файл раньше, чем публикует запись: если он умер
+        # между этими шагами, общий с ним файл новее копии в памяти
+        for account in accounts:
+            if account.name not in self._write_files:
+                account.positions = None
+                account.risk.bootstrap(load_positions(account), account.trades_csv)
+        if not self._write_messages:
+            load_last_message_ids()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                conn = Client(self.address, authkey=self.authkey)
+            except Exception:
+                self._stop_event.wait(HA_LEASE_POLL)
+                continue
+            logger.info(f"Standby подключён к активному узлу {self.address}.")
+            try:
+                while not self._stop_event.is_set():
+                    if conn.poll(0.5):
+                        self.apply(conn.recv())
+            except (EOFError, OSError):
+                logger.warning("Связь с активным узлом потеряна.")
+            finally:
+                conn.close()
+
+    def apply(self, record):
+        kind = record[0]
+        if kind == "snapshot":
+            snapshot = record[1]
+            for data in snapshot["accounts"]:
+                account = get_account(data["name"])
+                if account is None:
+                    continue
+                if os.path.realpath(account.positions_json) != data["positions_json"]:
+                    self._write_files.add(account.name)
+                account.risk.bootstrap(data["positions"])
+                account.risk.daily_realized = to_decimal(data["daily_realized"])
+                account.positions = data["positions"]
+                if account.name in self._write_files:
+                    save_positions(account, account.positions)
+            self._write_messages = (
+                os.path.realpath(LAST_MESSAGES_JSON) != snapshot["last_messages_json"]
+            )
+            last_message_ids.update(snapshot["last_message_ids"])
+            if self._write_messages:
+                save_last_message_ids()
+        elif kind == "position":
+            _, name, symbol, pos = record
+            account = get_account(name)
+            if account is None:
+                return
+            positions = load_positions(account)
+            before = to_decimal(
+                positions.get(symbol, {}).get("realized_pnl_total", "0")
+            )
+            positions[symbol] = pos
+            account.risk.on_fill(
+                symbol, pos, to_decimal(pos.get("realized_pnl_total", "0")) - before
+            )
+            if name in self._write_files:
+                save_positions(account, positions)
+        elif kind == "trade":
+            _, name, row = record
+            account = get_account(name)
+            if account is not None and name in self._write_files:
+                write_trade_row(account, row)
+        elif kind == "message":
+            _, chat_id, message_id = record
+            if message_id > last_message_ids.get(chat_id, 0):
+                last_message_ids[chat_id] = message_id
+                if self._write_messages:
+                    save_last_message_ids()
+
+
+def get_account(name):
+    for account in accounts:
+        if account.name == name:
+            return account
+    return None
+
+
+def warm_up_prices(account):
+    # с одной биржей ExchangeRouter.rank() цены не запрашивает — греть нечего
+    return len(account.adapters) > 1
+
+
+def warm_up_interval():
+    ttls = [BALANCE_CACHE_TTL]
+    if any(warm_up_prices(account) for account in accounts):
+        ttls.append(PRICE_CACHE_TTL)
+    return min([HA_WARM_INTERVAL] + [ttl / 2 for ttl in ttls if ttl > 0])
+
+
+def warm_up_accounts():
+    # держим соединения открытыми, а кэши инструментов, цен и балансов свежими:
+    # балансы и цены перечитываются принудительно, иначе запись, взятая из кэша
+    # незадолго до истечения TTL, протухнет до следующего прогрева
+    for account in accounts:
+        for adapter in account.adapters:
+            try:
+                account.invalidate_balance(adapter.name)
+                get_usdt_balance(account, adapter)
+                for symbol in SPOT_SYMBOLS:
+                    adapter.get_instrument_info(symbol)
+                    if warm_up_prices(account):
+                        account.router.quote(adapter, symbol, refresh=True)
+            except Exception as e:
+                account.logger.debug(f"Прогрев {adapter.name} не удался: {e}")
+
+
+def run_ha():
+    global replicator
+    init_accounts()
+    load_last_message_ids()
+    address = parse_address(HA_REPLICATION_ADDRESS)
+    lease = FileLease(HA_LEASE_FILE)
+    takeover = not lease.try_acquire()
+    if takeover:
+        logger.info(f"Standby: lease {HA_LEASE_FILE} занят, жду активный узел...")
+        follower = ReplicaFollower(address, HA_REPLICATION_AUTHKEY)
+        follower.start()
+        warm_interval = warm_up_interval()
+        next_warm = 0.0
+        while not lease.try_acquire():
+            if time.monotonic() >= next_warm:
+                warm_up_accounts()
+                next_warm = time.monotonic() + warm_interval
+            time.sleep(max(0.0, min(HA_LEASE_POLL, next_warm - time.monotonic())))
+        follower.stop()
+        follower.join()
+        follower.reload_shared_files()
         logger.warning(
-            f"Сообщение не является торговым сигналом или не соответствует шаблону. Результат парсинга (signal): {signal}"
+            "Lease получен — standby становится активным, подключаюсь к Telegram."
         )
+    replicator = ReplicationServer(address, HA_REPLICATION_AUTHKEY)
+    # при холодном старте пропущенные сообщения не исполняются; после takeover
+    # main() дочитывает их уже после регистрации обработчика
+    init_telegram_client()
+    client.loop.run_until_complete(main(takeover))
 
 
-# --- 7. Запуск ---
-async def main():
+# --- 9. Запуск ---
+async def main(takeover=False):
+    profiler.watch()
     await client.start()
+    chats = await resolve_channels(client, target_channels)
+    client.add_event_handler(handler, events.NewMessage(chats=chats))
+    if takeover:
+        await catch_up_channels(client, chats)
     logger.info("Бот успешно запущен и ожидает новые сообщения...")
     await client.run_until_disconnected()
 
 
 if __name__ == "__main__":
-    client.loop.run_until_complete(main())
+    if BOT_MODE == "split":
+        run_split()
+    elif HA_ENABLED:
+        run_ha()
+    else:
+        init_telegram_client()
+        init_accounts()
+        client.loop.run_until_complete(main())
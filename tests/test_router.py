@@ -0,0 +1,104 @@
+import os
+import logging
+import tempfile
+import unittest
+from decimal import Decimal
+
+import main
+
+logging.disable(logging.CRITICAL)
+
+SYMBOL = "BTCUSDT"
+
+
+class FakeAdapter(main.ExchangeAdapter):
+    """Локальная биржа без сети: фиксированные цена и балансы."""
+
+    def __init__(self, name, price, usdt="5000", base="0"):
+        self.name = name
+        self.price = Decimal(price)
+        self.usdt = Decimal(usdt)
+        self.base = Decimal(base)
+        self.orders = []
+
+    def get_usdt_balance(self):
+        return self.usdt
+
+    def get_base_balance(self, symbol):
+        return self.base
+
+    def get_last_price(self, symbol):
+        return self.price
+
+    def get_instrument_info(self, symbol):
+        return {"base_precision": 4}
+
+    def place_market_order(self, symbol, side, qty, quote_qty=False):
+        self.orders.append((symbol, side, qty, quote_qty))
+        return {"result": {"orderId": f"{self.name}-{len(self.orders)}"}}
+
+    def get_exec_price(self, response, symbol):
+        return self.price
+
+
+class RouterTest(unittest.TestCase):
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.TemporaryDirectory()
+        os.chdir(self._tmp.name)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
+
+    def make_account(self, adapters):
+        account = main.Account("test", None, None, "trades.csv", "positions.json")
+        account.connect(adapters)
+        account.router = main.ExchangeRouter(adapters, mode="price")
+        return account
+
+    def test_rank_by_price(self):
+        cheap = FakeAdapter("cheap", "99")
+        dear = FakeAdapter("dear", "101")
+        router = main.ExchangeRouter([dear, cheap], mode="price")
+        self.assertEqual(router.rank(SYMBOL, "Buy"), [cheap, dear])
+        self.assertEqual(router.rank(SYMBOL, "Sell"), [dear, cheap])
+
+    def test_unpriced_venue_ranks_last(self):
+        dead = FakeAdapter("dead", "0")
+        live = FakeAdapter("live", "100")
+        router = main.ExchangeRouter([dead, live], mode="price")
+        self.assertEqual(router.rank(SYMBOL, "Buy"), [live, dead])
+
+    def test_buy_falls_back_to_funded_venue(self):
+        cheap = FakeAdapter("cheap", "99", usdt="10")
+        funded = FakeAdapter("funded", "101", usdt=str(main.TRADE_AMOUNT_USD))
+        account = self.make_account([cheap, funded])
+        adapter, balance = main.select_buy_venue(account, SYMBOL)
+        self.assertIs(adapter, funded)
+        self.assertEqual(balance, main.TRADE_AMOUNT_USD)
+
+    def test_close_only_on_venue_holding_lots(self):
+        dear = FakeAdapter("dear", "101")
+        holder = FakeAdapter("holder", "99")
+        account = self.make_account([dear, holder])
+        main.update_positions_and_compute_pnl(
+            account, SYMBOL, "Buy", "90", "2", venue="holder"
+        )
+        main.close_spot_position(account, SYMBOL)
+        self.assertEqual(dear.orders, [])
+        self.assertEqual(len(holder.orders), 1)
+        self.assertEqual(holder.orders[0][:2], (SYMBOL, "Sell"))
+        self.assertEqual(main.get_local_long_qty(account, SYMBOL, "holder"), 0)
+
+    def test_close_without_lots_uses_venue_with_balance(self):
+        dear = FakeAdapter("dear", "101")
+        holder = FakeAdapter("holder", "99", base="1.5")
+        account = self.make_account([dear, holder])
+        main.close_spot_position(account, SYMBOL)
+        self.assertEqual(dear.orders, [])
+        self.assertEqual(len(holder.orders), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()